@@ -1,30 +1,30 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from .rag import ask_question, prepare_video_context
+from .rag import ask_question, prepare_video_context, warm_up_embeddings
 
-app = FastAPI()
+router = APIRouter()
 
-raw_origins = os.getenv("ALLOWED_ORIGINS", "*").strip()
-if raw_origins == "*":
-    cors_origins = ["*"]
-    cors_allow_credentials = False
-else:
+def _cors_config() -> tuple[list[str], bool]:
+    """Parse ALLOWED_ORIGINS into (origins, allow_credentials)."""
+    raw_origins = os.getenv("ALLOWED_ORIGINS", "*").strip()
+    if raw_origins == "*":
+        return ["*"], False
     cors_origins = [origin for origin in (item.strip() for item in raw_origins.split(",")) if origin]
-    cors_allow_credentials = True
     if not cors_origins:
         raise RuntimeError("ALLOWED_ORIGINS must list at least one origin or be '*'")
+    return cors_origins, True
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=cors_origins,
-    allow_credentials=cors_allow_credentials,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the embedding model at startup so the first request doesn't pay for it."""
+    await asyncio.to_thread(warm_up_embeddings)
+    yield
 
 class AskRequest(BaseModel):
     youtube_url: str
@@ -39,20 +39,34 @@ class PrepareRequest(BaseModel):
     youtube_url: str
 
 
-@app.post("/prepare")
+@router.post("/prepare")
 async def prepare(request: PrepareRequest) -> dict[str, str]:
     """Pre-build the vector index so later /ask calls are faster."""
     try:
-        prepare_video_context(request.youtube_url)
+        await asyncio.to_thread(prepare_video_context, request.youtube_url)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
     return {"status": "ready"}
 
-@app.post("/ask", response_model=AskResponse)
+@router.post("/ask", response_model=AskResponse)
 async def ask(request: AskRequest) -> AskResponse:
     try:
-        answer, sources = ask_question(request.youtube_url, request.question)
+        answer, sources = await ask_question(request.youtube_url, request.question)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
     return AskResponse(answer=answer, sources=sources)
 
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    cors_origins, cors_allow_credentials = _cors_config()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=cors_origins,
+        allow_credentials=cors_allow_credentials,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+app = create_app()
@@ -7,30 +7,48 @@ from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
-from typing import Dict
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStoreRetriever
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterator, Tuple
+from pathlib import Path
+import asyncio
+import hashlib
 import logging
+import pickle
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import faiss
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+_VIDEO_ID_RE = re.compile(r"(?:youtube\.com/watch\?(?:.*&)?v=|youtu\.be/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])")
+
 def extract_video_id(youtube_url: str) -> str:
     """Extract the video ID from a YouTube URL."""
-    if "youtube.com/watch?v=" in youtube_url:
-        return youtube_url.split("v=")[1].split("&")[0]
-    elif "youtu.be/" in youtube_url:
-        return youtube_url.split("youtu.be/")[1].split("?")[0]
-    else:
+    match = _VIDEO_ID_RE.search(youtube_url)
+    if not match:
         raise ValueError("Invalid YouTube URL")
+    return match.group(1)
 
-def get_transcript(youtube_url:str)->str:
-    """Get the transcript of youTube video from url."""
+def get_transcript_snippets(youtube_url:str)->list[str]:
+    """Get the transcript of youTube video from url as its caption snippets."""
     video_id = extract_video_id(youtube_url)
     try:
         transcipt_list = YouTubeTranscriptApi().fetch(video_id)
     
-        transcipt = " ".join(snippet.text for snippet in transcipt_list)
-        return transcipt
+        return [snippet.text for snippet in transcipt_list]
     
     except TranscriptsDisabled as exc:
         logger.warning("No transcript available for this video.")
@@ -38,48 +56,361 @@ def get_transcript(youtube_url:str)->str:
     except Exception as exc:
         logger.exception("Failed to fetch transcript for %s", youtube_url)
         raise RuntimeError("Unable to fetch transcript.") from exc
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 200
+TRANSCRIPT_BLOCK_CHARS = CHUNK_SIZE * 8
+
+def _transcript_blocks(snippets: list[str]) -> Iterator[str]:
+    """Group caption snippets into blocks of a few chunks each, so the splitter never sees the whole transcript at once."""
+    block: list[str] = []
+    size = 0
+    for text in snippets:
+        block.append(text)
+        size += len(text) + 1
+        if size >= TRANSCRIPT_BLOCK_CHARS:
+            yield " ".join(block)
+            block, size = [], 0
+    if block:
+        yield " ".join(block)
     
-video_index_cache: Dict[str, FAISS] = {}     
+INDEX_CACHE_DIR = Path(os.getenv("INDEX_CACHE_DIR", "cache"))
+# Bump whenever the index type, quantization or chunking changes so stale layouts get rebuilt.
+INDEX_FORMAT_VERSION = 2
+
+def _index_cache_path(video_id: str) -> Path:
+    """On-disk location of the persisted FAISS index for a video."""
+    # Vectors from different backends live in different spaces, so key on the model too.
+    key = hashlib.sha256(f"v{INDEX_FORMAT_VERSION}:{EMBEDDINGS_BACKEND}:{video_id}".encode()).hexdigest()
+    return INDEX_CACHE_DIR / key
+
+def _save_vectorstore(vectorstore: FAISS, cache_path: Path) -> None:
+    """Persist the index via a temp dir + rename.
+
+    An existing index is renamed aside before the swap rather than deleted in place, so a
+    concurrent reader sees either a complete directory or none at all, never a half-deleted one.
+    """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f"{cache_path.name}.", suffix=".tmp", dir=cache_path.parent))
+    old_dir = tmp_dir.with_suffix(".old")
+    try:
+        vectorstore.save_local(str(tmp_dir))
+        if cache_path.exists():
+            os.replace(cache_path, old_dir)
+        os.replace(tmp_dir, cache_path)
+    except Exception:
+        # Persisting is best-effort: the index is built and will still be served from memory.
+        logger.exception("Failed to persist vectorstore to %s", cache_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+FASTEMBED_MODEL = "BAAI/bge-small-en-v1.5"
+EMBEDDING_BATCH_SIZE = 64
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 32
+QUERY_BATCH_MAX = 32
+QUERY_BATCH_WINDOW_S = 0.01
+EMBEDDINGS_BACKENDS = ("huggingface", "fastembed", "infinity")
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "huggingface").strip().lower()
+if EMBEDDINGS_BACKEND not in EMBEDDINGS_BACKENDS:
+    raise RuntimeError(f"EMBEDDINGS_BACKEND must be one of {', '.join(EMBEDDINGS_BACKENDS)}, got {EMBEDDINGS_BACKEND!r}")
+INFINITY_API_URL = os.getenv("INFINITY_API_URL", "http://localhost:7997")
+
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0")) or os.cpu_count() or 1
+
+_embeddings: Embeddings | None = None
+_embeddings_lock = threading.Lock()
+
+class InferenceModeHuggingFaceEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings that encodes under torch.inference_mode() to skip autograd bookkeeping."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        import torch
+
+        with torch.inference_mode():
+            return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        import torch
+
+        with torch.inference_mode():
+            return super().embed_query(text)
+
+def _load_embeddings() -> Embeddings:
+    """Embedding model configured for batched encoding on the best available device."""
+    if EMBEDDINGS_BACKEND == "fastembed":
+        # ONNX Runtime on CPU, no torch import on this path.
+        from langchain_community.embeddings import FastEmbedEmbeddings
+
+        return FastEmbedEmbeddings(model_name=FASTEMBED_MODEL, batch_size=EMBEDDING_BATCH_SIZE)
+    if EMBEDDINGS_BACKEND == "infinity":
+        # Sidecar server batches requests from concurrent uploads/questions together.
+        from langchain_community.embeddings import InfinityEmbeddings
+
+        return InfinityEmbeddings(model=EMBEDDING_MODEL, infinity_api_url=INFINITY_API_URL)
+
+    import torch
+
+    # Container defaults often leave torch on a single intra-op thread.
+    torch.set_num_threads(TORCH_THREADS)
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Only allowed before torch has started any parallel work.
+        logger.debug("torch inter-op thread count already fixed")
+
+    return InferenceModeHuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE, "normalize_embeddings": True},
+    )
+
+class BatchedQueryEmbeddings(Embeddings):
+    """Coalesces questions arriving within a short window into one embedding forward pass.
+
+    Questions are embedded with the wrapped model's embed_documents, so it must only wrap
+    models whose query and document encodings are the same.
+    """
+
+    def __init__(self, embeddings: Embeddings, *, max_batch: int = QUERY_BATCH_MAX, window_s: float = QUERY_BATCH_WINDOW_S):
+        self._embeddings = embeddings
+        self._max_batch = max_batch
+        self._window_s = window_s
+        self._queue: "queue.Queue[tuple[str, Future]]" = queue.Queue()
+        threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True).start()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._window_s
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                vectors = self._embeddings.embed_documents([text for text, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            if len(vectors) != len(batch):
+                exc = RuntimeError(f"Embedding backend returned {len(vectors)} vectors for {len(batch)} questions")
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+def _get_embeddings() -> Embeddings:
+    """Return the shared embedding model, loading it on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                model = _load_embeddings()
+                # Batching sends questions through embed_documents, so only wrap models that encode
+                # questions and chunks identically. FastEmbed's query_embed differs, and the
+                # Infinity server already batches on its side.
+                if isinstance(model, HuggingFaceEmbeddings) and not model.query_encode_kwargs:
+                    model = BatchedQueryEmbeddings(model)
+                _embeddings = model
+                logger.info("Embedding model loaded (backend=%s)", EMBEDDINGS_BACKEND)
+    return _embeddings
+
+def warm_up_embeddings() -> None:
+    """Load the embedding model ahead of the first request."""
+    _get_embeddings()
+
+def build_vectorstore_from_docs(docs: list[Document], embeddings: Embeddings) -> FAISS:
+    """Embed all chunks in one batched call and build the FAISS index from the vectors."""
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    # Similar-length texts share a batch, so less padding is wasted; results go back in doc order.
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embedded = embeddings.embed_documents([texts[i] for i in order])
+    vectors: list[list[float]] = [[] for _ in texts]
+    for pos, i in enumerate(order):
+        vectors[i] = embedded[pos]
+
+    # HNSW graph instead of the default flat index: sublinear search on long videos.
+    # Vectors are unit-normalized and stored as 8-bit scalars, a quarter of the fp32 footprint.
+    matrix = np.asarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(matrix)
+    index = faiss.IndexHNSWSQ(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.train(matrix)
+    index.add(matrix)
+
+    ids = [str(uuid.uuid4()) for _ in texts]
+    docstore = InMemoryDocstore(
+        {doc_id: Document(page_content=text, metadata=metadata) for doc_id, text, metadata in zip(ids, texts, metadatas)}
+    )
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+        normalize_L2=True,
+    )
+
+MAX_CACHED_VIDEOS = int(os.getenv("MAX_CACHED_VIDEOS", "32"))
+
+# Keyed by video id, so different URL shapes for one video share a single entry.
+video_index_cache: "OrderedDict[str, FAISS]" = OrderedDict()
+retriever_cache: Dict[Tuple[str, int], VectorStoreRetriever] = {}
+_cache_lock = threading.Lock()
+# Striped per-index build locks: one thread fetches/embeds a given video, others wait and reuse it.
+_build_locks = [threading.Lock() for _ in range(64)]
+yt_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def _drop_retrievers(video_id: str) -> None:
+    # Snapshot the keys: requests run in worker threads and may touch the cache concurrently.
+    for key in [key for key in list(retriever_cache) if key[0] == video_id]:
+        retriever_cache.pop(key, None)
+
+# What a truncated or incompatible index directory raises on load: faiss read_index errors
+# surface as RuntimeError, a damaged docstore pickle as UnpicklingError/EOFError.
+_CORRUPT_INDEX_ERRORS = (RuntimeError, pickle.UnpicklingError, EOFError)
+
+def _load_vectorstore(cache_path: Path, embeddings: Embeddings) -> FAISS:
+    return FAISS.load_local(
+        str(cache_path), embeddings, allow_dangerous_deserialization=True, normalize_L2=True
+    )
+
+def _cached_vectorstore(video_id: str) -> FAISS | None:
+    """Look up a live vectorstore and mark it as most recently used."""
+    with _cache_lock:
+        vectorstore = video_index_cache.get(video_id)
+        if vectorstore is not None:
+            video_index_cache.move_to_end(video_id)
+        return vectorstore
+
+def _store_vectorstore(video_id: str, vectorstore: FAISS) -> None:
+    """Cache a vectorstore, evicting the least recently used videos beyond MAX_CACHED_VIDEOS.
+
+    Evicted indexes are reloaded from their on-disk copy by build_get_pipline on the next lookup.
+    """
+    with _cache_lock:
+        video_index_cache[video_id] = vectorstore
+        video_index_cache.move_to_end(video_id)
+        _drop_retrievers(video_id)
+        while len(video_index_cache) > MAX_CACHED_VIDEOS:
+            evicted_id, _ = video_index_cache.popitem(last=False)
+            _drop_retrievers(evicted_id)
+            logger.info("Evicted vectorstore for video %s from memory", evicted_id)
+
+def _build_lock(cache_path: Path) -> threading.Lock:
+    return _build_locks[int(cache_path.name[:8], 16) % len(_build_locks)]
+
 def build_get_pipline(youtube_url: str, *, force_refresh: bool = False):
     """Build (or reuse) the RAG pipeline from a YouTube video URL."""
-    if not force_refresh and youtube_url in video_index_cache:
-        logger.info("Vectorstore cache hit for %s", youtube_url)
-        return video_index_cache[youtube_url]
-    transcript = get_transcript(youtube_url)
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200)
-    texts = splitter.create_documents([transcript])
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(texts, embeddings)
-    video_index_cache[youtube_url] = vectorstore
-    logger.info("Vectorstore built for %s (chunks=%d)", youtube_url, len(texts))
-    return vectorstore
+    video_id = extract_video_id(youtube_url)
+    if not force_refresh:
+        vectorstore = _cached_vectorstore(video_id)
+        if vectorstore is not None:
+            logger.info("Vectorstore cache hit for %s", youtube_url)
+            return vectorstore
+    cache_path = _index_cache_path(video_id)
+    with _build_lock(cache_path):
+        if not force_refresh:
+            # Another thread may have finished building while we waited.
+            vectorstore = _cached_vectorstore(video_id)
+            if vectorstore is not None:
+                logger.info("Vectorstore cache hit for %s", youtube_url)
+                return vectorstore
+        # Load the model outside the corruption handling below: its failures say nothing about the index.
+        embeddings = _get_embeddings()
+        if not force_refresh and cache_path.exists():
+            # A corrupt or incompatible directory would otherwise fail every request for this video;
+            # anything else (I/O errors, etc.) propagates and leaves the directory alone.
+            vectorstore = None
+            if not all((cache_path / name).exists() for name in ("index.faiss", "index.pkl")):
+                logger.warning("Discarding incomplete vectorstore at %s", cache_path)
+            else:
+                try:
+                    vectorstore = _load_vectorstore(cache_path, embeddings)
+                except _CORRUPT_INDEX_ERRORS:
+                    logger.exception("Discarding unreadable vectorstore at %s", cache_path)
+            if vectorstore is not None:
+                _store_vectorstore(video_id, vectorstore)
+                logger.info("Vectorstore loaded from disk for %s", youtube_url)
+                return vectorstore
+            shutil.rmtree(cache_path, ignore_errors=True)
+        texts: list[Document] = []
+        for block in _transcript_blocks(get_transcript_snippets(youtube_url)):
+            texts.extend(yt_splitter.create_documents([block]))
+        vectorstore = build_vectorstore_from_docs(texts, embeddings)
+        _save_vectorstore(vectorstore, cache_path)
+        _store_vectorstore(video_id, vectorstore)
+        logger.info("Vectorstore built for %s (chunks=%d)", youtube_url, len(texts))
+        return vectorstore
     
 def prepare_video_context(youtube_url: str, *, force_refresh: bool = False) -> None:
     """Call this right after the frontend receives a URL so the index is warm for later Q&A."""
     build_get_pipline(youtube_url, force_refresh=force_refresh)
     logger.info("Video context ready for %s", youtube_url)
 
-def ask_question(youtube_url:str,question:str)->tuple[str,list[str]]:
+def _get_retriever(youtube_url: str, k: int = 4) -> VectorStoreRetriever:
+    """Return a cached similarity retriever for the video's vectorstore."""
     vectorstore = build_get_pipline(youtube_url)
-    retriver = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k":4})
+    video_id = extract_video_id(youtube_url)
+    with _cache_lock:
+        retriever = retriever_cache.get((video_id, k))
+        if retriever is None:
+            retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            # Don't cache a retriever for a store that was evicted or replaced meanwhile; it would
+            # pin the old index in memory and keep serving from it.
+            if video_index_cache.get(video_id) is vectorstore:
+                retriever_cache[(video_id, k)] = retriever
+    return retriever
+
+_PROMPT = PromptTemplate(
+    template ="""You are a helpful assistant answerning questions based on the context below.
+    Context: {context}
+    Question: {question}
+    Answeer in a concise manner. and ans only based on the context provided. if the context does not contain the answer, say "I don't know".""",
+    input_variables=["context","question"]
+)
+
+_llm: ChatGoogleGenerativeAI | None = None
+_llm_lock = threading.Lock()
+
+def _get_llm() -> ChatGoogleGenerativeAI:
+    """Return the shared Gemini client so its HTTP connections are reused across questions."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-lite", temperature=0.5)
+    return _llm
+
+async def ask_question(youtube_url:str,question:str)->tuple[str,list[str]]:
+    # Building the index on a cache miss is CPU-bound, so keep it off the event loop.
+    retriver = await asyncio.to_thread(_get_retriever, youtube_url)
     
     logger.info("Answering question for %s | cache_size=%d", youtube_url, len(video_index_cache))
 
-    docs = retriver.invoke(question)
+    docs = await retriver.ainvoke(question)
     context = "\n".join([doc.page_content for doc in docs])
     
-    prompt = PromptTemplate(
-        template ="""You are a helpful assistant answerning questions based on the context below.
-        Context: {context}
-        Question: {question}
-        Answeer in a concise manner. and ans only based on the context provided. if the context does not contain the answer, say "I don't know".""",
-        input_variables=["context","question"]
-    )
-    
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-lite", temperature=0.5)
-    
-    final_prompt = prompt.format(context=context, question=question)
-    response =llm.invoke(final_prompt)
+    final_prompt = _PROMPT.format(context=context, question=question)
+    response = await _get_llm().ainvoke(final_prompt)
     
     answer = getattr(response, "text", None) or getattr(response, "content", str(response))
     sources = [getattr(d, "metadata", {}).get("source", "") for d in docs]